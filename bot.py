@@ -5,19 +5,27 @@ import html
 import logging
 import os
 import random
-from datetime import datetime, timedelta
-from typing import Dict, Optional
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as dtime, timedelta
+from functools import lru_cache, partial
+from itertools import cycle
+from typing import Any, Callable, Dict, FrozenSet, Optional, Set, Tuple, Union
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from dotenv import load_dotenv
 from telegram import (
     ForceReply,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    Message,
+    MessageEntity,
     ReplyKeyboardMarkup,
     Update,
 )
 from telegram.constants import ParseMode
-from telegram.error import BadRequest, Forbidden
+from telegram.error import BadRequest, Forbidden, RetryAfter
 from telegram.ext import (
     Application,
     ApplicationBuilder,
@@ -26,22 +34,27 @@ from telegram.ext import (
     ConversationHandler,
     ContextTypes,
     MessageHandler,
+    TypeHandler,
     filters,
 )
+from telegram.warnings import PTBUserWarning
 
 from storage import (
-    ChatMeta,
     Wish,
     count_stats,
+    count_stats_by_chat,
     create_wish,
     delete_wish,
     get_or_init_chat_meta,
     get_wish,
     list_chats,
-    list_wishes,
+    list_idle_chats,
+    list_wishes_page,
     mark_done,
     nearest_with_date,
+    nearest_with_date_by_chat,
     random_open_wish,
+    random_open_wish_by_chat,
 )
 from utils import (
     MOTIVATION_PHRASES,
@@ -65,6 +78,8 @@ logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s %(levelname)s [%(name)s] %(message)s",
 )
+# conversation_timeout re-schedules an APScheduler job on every /add update.
+logging.getLogger("apscheduler").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -74,7 +89,8 @@ if not TELEGRAM_BOT_TOKEN:
     raise RuntimeError("TELEGRAM_BOT_TOKEN не задан. Создайте .env на основе .env.example")
 
 ASK_TITLE, DETAILS = range(2)
-ADD_CONV_HANDLER: Optional[ConversationHandler] = None
+# Abandoned /add flows are dropped after a day so the state dict stays bounded.
+ADD_CONVERSATION_TIMEOUT = 24 * 60 * 60
 DRAFT_KEY = "new_wish"
 
 TIME_CODES = {
@@ -85,17 +101,95 @@ TIME_CODES = {
     "DATE": "🗓 Точная дата",
 }
 
+ADMIN_STATUSES = frozenset({"creator", "administrator"})
+ADMIN_CACHE_TTL = 60
+ADMIN_CACHE_MAX_SIZE = 10_000
+_admin_cache: Dict[Tuple[int, int], Tuple[float, bool]] = {}
+
+# Storage calls get their own small pool instead of sharing the loop's default executor.
+STORAGE_WORKERS = 4
+_storage_executor = ThreadPoolExecutor(max_workers=STORAGE_WORKERS, thread_name_prefix="storage")
+
+# Chats whose ChatMeta row is known to exist with the current DEFAULT_TZ.
+_known_chat_ids: Set[int] = set()
+
+DRAFT_REFRESH_DELAY = 0.1
+_pending_draft_refreshes: Dict[Tuple[int, int], Union[asyncio.TimerHandle, asyncio.Task]] = {}
+
+JOB_SEND_ATTEMPTS = 3
+# Job sends are spaced to stay under Telegram's ~30 messages/second broadcast limit.
+JOB_SEND_RATE = 25
+_job_send_lock = asyncio.Lock()
+_job_send_next_slot = 0.0
+POLLING_TIMEOUT = 30
+REMINDER_IDLE_DAYS = 14
+# Jobs fire at a fixed wall-clock time so restarts do not shift the schedule.
+try:
+    JOB_TZ = ZoneInfo(DEFAULT_TZ)
+except ZoneInfoNotFoundError:
+    JOB_TZ = ZoneInfo("UTC")
+JOB_TIME = dtime(10, 0, tzinfo=JOB_TZ)
+BIWEEKLY_ANCHOR = date(2024, 1, 1)
+# Pre-shuffled so each chat in a monthly run gets the next phrase without an RNG call.
+_motivation_phrases = cycle(random.sample(MOTIVATION_PHRASES, len(MOTIVATION_PHRASES)))
+
+BIWEEKLY_REMINDER_TEMPLATE = "Вы классные 💞 Добавим маленькую хотелку? ✨\n• {title} — {description}"
+
 BOTTOM_KEYBOARD = ReplyKeyboardMarkup(
     [["➕ Добавить", "📋 Список"], ["🎲 Рандом", "🧾 Сводка"]],
     resize_keyboard=True,
 )
 
+START_TEXT = (
+    "Привет! Я романтичный wishlist-бот. Жмите «➕ Добавить», чтобы записать идею,"
+    " а /help подскажет команды."
+)
+HELP_TEXT = (
+    "Команды:\n"
+    "/add — добавить новое желание\n"
+    "/list — показать текущий список\n"
+    "/random — идея из локального банка\n"
+    "/summary — короткая сводка\n"
+    "/done <id> — отметить выполненным (только админы)\n"
+    "/delete <id> — удалить (только админы)"
+)
+
+TITLE_PROMPT_REPLY = ForceReply(selective=True, input_field_placeholder="Название желания (до 120 символов)")
+TITLE_RETRY_REPLY = ForceReply(selective=True, input_field_placeholder="Название желания")
+TITLE_SHORTEN_REPLY = ForceReply(selective=True, input_field_placeholder="Краткое название")
+
+
+BACK_ROW = [InlineKeyboardButton("⬅ Назад", callback_data="ADD:BACK")]
+
+ADD_MAIN_KEYBOARD = InlineKeyboardMarkup(
+    [
+        [
+            InlineKeyboardButton("➕ Фото", callback_data="ADD:PHOTO"),
+            InlineKeyboardButton("💰 Цена", callback_data="ADD:PRICE:MENU"),
+            InlineKeyboardButton("⏰ Когда", callback_data="ADD:WHEN:MENU"),
+        ],
+        [InlineKeyboardButton("🏷 Теги", callback_data="ADD:TAGS:MENU"), InlineKeyboardButton("✅ Сохранить", callback_data="ADD:SAVE")],
+        [InlineKeyboardButton("🚫 Отмена", callback_data="ADD:CANCEL")],
+    ]
+)
+
+ADD_PRICE_KEYBOARD = InlineKeyboardMarkup(
+    [
+        [
+            InlineKeyboardButton("Есть", callback_data="ADD:PRICE:SET:YES"),
+            InlineKeyboardButton("Нет", callback_data="ADD:PRICE:SET:NO"),
+        ],
+        BACK_ROW,
+    ]
+)
 
-def _end_conversation_for_user(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int) -> None:
-    if ADD_CONV_HANDLER:
-        ADD_CONV_HANDLER.conversations[(chat_id, user_id)] = ConversationHandler.END
+ADD_WHEN_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(label, callback_data=f"ADD:WHEN:SET:{code}")] for code, label in TIME_CODES.items()]
+    + [BACK_ROW]
+)
 
 
+@lru_cache(maxsize=4096)
 def wish_action_keyboard(wish_id: int, done: bool = False) -> InlineKeyboardMarkup:
     if done:
         buttons = [[InlineKeyboardButton("🗑 Удалить", callback_data=f"WISH:DEL:{wish_id}")]]
@@ -109,46 +203,33 @@ def wish_action_keyboard(wish_id: int, done: bool = False) -> InlineKeyboardMark
     return InlineKeyboardMarkup(buttons)
 
 
+# (selected, unselected) button for every tag, in TAG_OPTIONS order.
+TAG_BUTTONS = [
+    (
+        InlineKeyboardButton(f"✅ {tag}", callback_data=f"ADD:TAGS:TOGGLE:{index}"),
+        InlineKeyboardButton(f"➕ {tag}", callback_data=f"ADD:TAGS:TOGGLE:{index}"),
+    )
+    for index, tag in enumerate(TAG_OPTIONS)
+]
+
+
+@lru_cache(maxsize=None)
+def _tags_keyboard(selected: FrozenSet[str]) -> InlineKeyboardMarkup:
+    rows = [[on if tag in selected else off] for tag, (on, off) in zip(TAG_OPTIONS, TAG_BUTTONS)]
+    rows.append(BACK_ROW)
+    return InlineKeyboardMarkup(rows)
+
+
 def add_keyboard(draft: Dict[str, object]) -> InlineKeyboardMarkup:
     menu = draft.get("menu", "main")
     if menu == "price":
-        return InlineKeyboardMarkup(
-            [
-                [
-                    InlineKeyboardButton("Есть", callback_data="ADD:PRICE:SET:YES"),
-                    InlineKeyboardButton("Нет", callback_data="ADD:PRICE:SET:NO"),
-                ],
-                [InlineKeyboardButton("⬅ Назад", callback_data="ADD:BACK")],
-            ]
-        )
+        return ADD_PRICE_KEYBOARD
     if menu == "when":
-        rows = [
-            [InlineKeyboardButton(label, callback_data=f"ADD:WHEN:SET:{code}")]
-            for code, label in TIME_CODES.items()
-        ]
-        rows.append([InlineKeyboardButton("⬅ Назад", callback_data="ADD:BACK")])
-        return InlineKeyboardMarkup(rows)
+        return ADD_WHEN_KEYBOARD
     if menu == "tags":
-        selected = set(tags_from_csv(draft.get("tags")))
-        rows = []
-        for index, tag in enumerate(TAG_OPTIONS):
-            flag = "✅" if tag in selected else "➕"
-            rows.append(
-                [InlineKeyboardButton(f"{flag} {tag}", callback_data=f"ADD:TAGS:TOGGLE:{index}")]
-            )
-        rows.append([InlineKeyboardButton("⬅ Назад", callback_data="ADD:BACK")])
-        return InlineKeyboardMarkup(rows)
-    return InlineKeyboardMarkup(
-        [
-            [
-                InlineKeyboardButton("➕ Фото", callback_data="ADD:PHOTO"),
-                InlineKeyboardButton("💰 Цена", callback_data="ADD:PRICE:MENU"),
-                InlineKeyboardButton("⏰ Когда", callback_data="ADD:WHEN:MENU"),
-            ],
-            [InlineKeyboardButton("🏷 Теги", callback_data="ADD:TAGS:MENU"), InlineKeyboardButton("✅ Сохранить", callback_data="ADD:SAVE")],
-            [InlineKeyboardButton("🚫 Отмена", callback_data="ADD:CANCEL")],
-        ]
-    )
+        # Only known tags affect the markup, which keeps the cache at 2**len(TAG_OPTIONS) entries.
+        return _tags_keyboard(frozenset(tags_from_csv(draft.get("tags"))).intersection(TAG_OPTIONS))
+    return ADD_MAIN_KEYBOARD
 
 
 def draft_preview_text(draft: Dict[str, object]) -> str:
@@ -168,50 +249,88 @@ def draft_preview_text(draft: Dict[str, object]) -> str:
     return "\n".join(parts)
 
 
-async def refresh_draft_message(context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object]) -> None:
+async def _edit_draft_message(context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object]) -> None:
     message_id = draft.get("message_id")
     chat_id = draft.get("message_chat_id")
-    if not message_id or not chat_id:
+    rendered = (draft_preview_text(draft), add_keyboard(draft))
+    # Telegram rejects identical edits with "message is not modified"; skip the round trip.
+    if rendered == draft.get("rendered"):
         return
+    text, keyboard = rendered
     try:
         await context.bot.edit_message_text(
-            text=draft_preview_text(draft),
+            text=text,
             chat_id=chat_id,
             message_id=message_id,
             parse_mode=ParseMode.HTML,
-            reply_markup=add_keyboard(draft),
+            reply_markup=keyboard,
         )
+        draft["rendered"] = rendered
     except BadRequest as exc:
         logger.debug("Не удалось обновить черновик: %s", exc)
 
 
-async def ensure_chat_meta(chat_id: int) -> ChatMeta:
-    return await asyncio.to_thread(get_or_init_chat_meta, chat_id, DEFAULT_TZ)
+def _cancel_draft_refresh(draft: Dict[str, object]) -> None:
+    pending = _pending_draft_refreshes.pop((draft.get("message_chat_id"), draft.get("message_id")), None)
+    if pending:
+        pending.cancel()
+
+
+async def _run_draft_refresh(
+    context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object], key: Tuple[int, int]
+) -> None:
+    try:
+        await _edit_draft_message(context, draft)
+    finally:
+        if _pending_draft_refreshes.get(key) is asyncio.current_task():
+            del _pending_draft_refreshes[key]
+
+
+def _start_draft_refresh(
+    context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object], key: Tuple[int, int]
+) -> None:
+    # A plain task, so cancelling it before its first step closes the coroutine cleanly.
+    _pending_draft_refreshes[key] = asyncio.get_running_loop().create_task(
+        _run_draft_refresh(context, draft, key)
+    )
+
+
+async def refresh_draft_message(context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object]) -> None:
+    message_id = draft.get("message_id")
+    chat_id = draft.get("message_chat_id")
+    if not message_id or not chat_id:
+        return
+    _cancel_draft_refresh(draft)
+    key = (chat_id, message_id)
+    # Coalesce bursts of taps into one edit; the coroutine is only created when the timer fires
+    # and reads the live draft dict.
+    _pending_draft_refreshes[key] = asyncio.get_running_loop().call_later(
+        DRAFT_REFRESH_DELAY, _start_draft_refresh, context, draft, key
+    )
+
+
+async def run_storage(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_storage_executor, partial(func, *args, **kwargs))
+
+
+async def ensure_chat_meta(chat_id: int) -> None:
+    if chat_id in _known_chat_ids:
+        return
+    await run_storage(get_or_init_chat_meta, chat_id, DEFAULT_TZ)
+    _known_chat_ids.add(chat_id)
 
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
     await ensure_chat_meta(chat_id)
-    text = (
-        "Привет! Я романтичный wishlist-бот. Жмите «➕ Добавить», чтобы записать идею,"
-        " а /help подскажет команды."
-    )
-    await update.effective_message.reply_text(text, reply_markup=BOTTOM_KEYBOARD)
+    await update.effective_message.reply_text(START_TEXT, reply_markup=BOTTOM_KEYBOARD)
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if update.effective_chat:
         await ensure_chat_meta(update.effective_chat.id)
-    text = (
-        "Команды:\n"
-        "/add — добавить новое желание\n"
-        "/list — показать текущий список\n"
-        "/random — идея из локального банка\n"
-        "/summary — короткая сводка\n"
-        "/done <id> — отметить выполненным (только админы)\n"
-        "/delete <id> — удалить (только админы)"
-    )
-    await update.effective_message.reply_text(text, reply_markup=BOTTOM_KEYBOARD)
+    await update.effective_message.reply_text(HELP_TEXT, reply_markup=BOTTOM_KEYBOARD)
 
 
 async def add_entry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -230,12 +349,12 @@ async def add_entry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         "menu": "main",
         "message_id": None,
         "message_chat_id": None,
+        "rendered": None,
     }
     context.user_data[DRAFT_KEY] = draft
-    reply_markup = ForceReply(selective=True, input_field_placeholder="Название желания (до 120 символов)")
     await update.effective_message.reply_text(
         "Как назовём желание? Ответьте реплаем на это сообщение 💡",
-        reply_markup=reply_markup,
+        reply_markup=TITLE_PROMPT_REPLY,
     )
     return ASK_TITLE
 
@@ -251,13 +370,13 @@ async def add_receive_title(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if not title:
         await message.reply_text(
             "Нужно придумать название. Попробуйте ещё раз 💡",
-            reply_markup=ForceReply(selective=True, input_field_placeholder="Название желания"),
+            reply_markup=TITLE_RETRY_REPLY,
         )
         return ASK_TITLE
     if len(title) > 120:
         await message.reply_text(
             "Название должно быть короче 120 символов. Давайте чуть компактнее ✂️",
-            reply_markup=ForceReply(selective=True, input_field_placeholder="Краткое название"),
+            reply_markup=TITLE_SHORTEN_REPLY,
         )
         return ASK_TITLE
     draft["title"] = title
@@ -266,6 +385,7 @@ async def add_receive_title(update: Update, context: ContextTypes.DEFAULT_TYPE)
     sent = await message.reply_text(preview, parse_mode=ParseMode.HTML, reply_markup=keyboard)
     draft["message_id"] = sent.message_id
     draft["message_chat_id"] = sent.chat_id
+    draft["rendered"] = (preview, keyboard)
     return DETAILS
 
 
@@ -328,6 +448,7 @@ async def add_handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 
 async def add_cancel(context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object]) -> None:
+    _cancel_draft_refresh(draft)
     message_id = draft.get("message_id")
     chat_id = draft.get("message_chat_id")
     if message_id and chat_id:
@@ -342,17 +463,28 @@ async def add_cancel(context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object
     context.user_data.pop(DRAFT_KEY, None)
 
 
-async def add_save(query_update: Update, context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object]) -> None:
+async def _strip_draft_keyboard(context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object]) -> None:
+    message_id = draft.get("message_id")
+    message_chat_id = draft.get("message_chat_id")
+    if not message_id or not message_chat_id:
+        return
+    try:
+        await context.bot.edit_message_reply_markup(chat_id=message_chat_id, message_id=message_id, reply_markup=None)
+    except BadRequest:
+        pass
+
+
+async def add_save(query_update: Update, context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object]) -> Optional[int]:
     query = query_update.callback_query
     if not draft.get("title"):
         await query.answer(
             "Нужно придумать название. Без него идея не сохранится 💡",
             show_alert=True,
         )
-        return
+        return None
     chat_id = draft["chat_id"]
     user = query.from_user
-    wish = await asyncio.to_thread(
+    wish = await run_storage(
         create_wish,
         chat_id=chat_id,
         user_id=user.id,
@@ -367,19 +499,13 @@ async def add_save(query_update: Update, context: ContextTypes.DEFAULT_TYPE, dra
         tags=draft.get("tags") or None,
     )
 
-    message_id = draft.get("message_id")
-    message_chat_id = draft.get("message_chat_id")
-    if message_id and message_chat_id:
-        try:
-            await context.bot.edit_message_reply_markup(chat_id=message_chat_id, message_id=message_id, reply_markup=None)
-        except BadRequest:
-            pass
+    _cancel_draft_refresh(draft)
     context.user_data.pop(DRAFT_KEY, None)
 
     caption = format_wish_caption(wish)
     keyboard = wish_action_keyboard(wish.id)
     if wish.photo_file_id:
-        await context.bot.send_photo(
+        send_card = context.bot.send_photo(
             chat_id=chat_id,
             photo=wish.photo_file_id,
             caption=caption,
@@ -387,185 +513,211 @@ async def add_save(query_update: Update, context: ContextTypes.DEFAULT_TYPE, dra
             reply_markup=keyboard,
         )
     else:
-        await context.bot.send_message(
+        send_card = context.bot.send_message(
             chat_id=chat_id,
             text=caption,
             parse_mode=ParseMode.HTML,
             reply_markup=keyboard,
         )
+    # The three calls are independent, so issue them together once the wish is stored.
+    await asyncio.gather(
+        _strip_draft_keyboard(context, draft),
+        send_card,
+        query.answer("Желание сохранено ✨"),
+    )
+    return ConversationHandler.END
 
-    _end_conversation_for_user(context, chat_id, user.id)
 
-    await query.answer("Желание сохранено ✨")
+async def _add_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object], arg: str) -> None:
+    query = update.callback_query
+    draft["awaiting"] = "photo"
+    draft["menu"] = "main"
+    await refresh_draft_message(context, draft)
+    if query.message:
+        await query.message.reply_text(
+            "Пришлите одно фото отдельным сообщением — оно попадёт в карточку. 📸"
+        )
+    await query.answer("Жду фото 📸")
+
+
+async def _add_open_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object], arg: str) -> None:
+    draft["menu"] = arg
+    await refresh_draft_message(context, draft)
+    await update.callback_query.answer()
 
 
-async def add_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def _add_price_yes(update: Update, context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object], arg: str) -> None:
     query = update.callback_query
-    draft = context.user_data.get(DRAFT_KEY)
-    if not draft:
-        await query.answer("Черновик не найден. Начните заново через /add.", show_alert=True)
-        try:
-            await query.edit_message_reply_markup(reply_markup=None)
-        except BadRequest:
-            pass
-        return
-    data = query.data.split(":")
-    if len(data) < 2:
-        await query.answer()
-        return
+    draft["price_flag"] = True
+    draft["price_amount"] = None
+    draft["awaiting"] = "price"
+    draft["menu"] = "main"
+    await refresh_draft_message(context, draft)
+    if query.message:
+        await query.message.reply_text("Напишите сумму или ориентир стоимости 💸")
+    await query.answer("Введите сумму")
 
-    action = data[1]
 
-    if action == "PHOTO":
-        draft["awaiting"] = "photo"
-        draft["menu"] = "main"
+async def _add_price_no(update: Update, context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object], arg: str) -> None:
+    draft["price_flag"] = False
+    draft["price_amount"] = None
+    draft["awaiting"] = None
+    draft["menu"] = "main"
+    await refresh_draft_message(context, draft)
+    await update.callback_query.answer("Отмечено: без бюджета")
+
+
+async def _add_when_set(update: Update, context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object], arg: str) -> None:
+    query = update.callback_query
+    label = TIME_CODES.get(arg)
+    if not label:
+        await query.answer()
+        return
+    draft["time_horizon"] = label
+    draft["menu"] = "main"
+    draft["due_date"] = None
+    if arg == "DATE":
+        draft["awaiting"] = "due_date"
         await refresh_draft_message(context, draft)
         if query.message:
-            await query.message.reply_text(
-                "Пришлите одно фото отдельным сообщением — оно попадёт в карточку. 📸"
-            )
-        await query.answer("Жду фото 📸")
+            await query.message.reply_text("Введите дату в формате YYYY-MM-DD.")
+        await query.answer("Жду дату")
         return
+    draft["awaiting"] = None
+    await refresh_draft_message(context, draft)
+    await query.answer("Срок обновлён")
 
-    if action == "PRICE":
-        if len(data) == 3 and data[2] == "MENU":
-            draft["menu"] = "price"
-            await refresh_draft_message(context, draft)
-            await query.answer()
-            return
-        if len(data) == 4 and data[2] == "SET":
-            choice = data[3]
-            if choice == "YES":
-                draft["price_flag"] = True
-                draft["price_amount"] = None
-                draft["awaiting"] = "price"
-                draft["menu"] = "main"
-                await refresh_draft_message(context, draft)
-                if query.message:
-                    await query.message.reply_text("Напишите сумму или ориентир стоимости 💸")
-                await query.answer("Введите сумму")
-                return
-            if choice == "NO":
-                draft["price_flag"] = False
-                draft["price_amount"] = None
-                draft["awaiting"] = None
-                draft["menu"] = "main"
-                await refresh_draft_message(context, draft)
-                await query.answer("Отмечено: без бюджета")
-                return
-
-    if action == "WHEN":
-        if len(data) == 3 and data[2] == "MENU":
-            draft["menu"] = "when"
-            await refresh_draft_message(context, draft)
-            await query.answer()
-            return
-        if len(data) == 4 and data[2] == "SET":
-            code = data[3]
-            label = TIME_CODES.get(code)
-            if not label:
-                await query.answer()
-                return
-            draft["time_horizon"] = label
-            draft["menu"] = "main"
-            if code == "DATE":
-                draft["due_date"] = None
-                draft["awaiting"] = "due_date"
-                await refresh_draft_message(context, draft)
-                if query.message:
-                    await query.message.reply_text("Введите дату в формате YYYY-MM-DD.")
-                await query.answer("Жду дату")
-                return
-            draft["due_date"] = None
-            draft["awaiting"] = None
-            await refresh_draft_message(context, draft)
-            await query.answer("Срок обновлён")
-            return
-
-    if action == "TAGS":
-        if len(data) == 3 and data[2] == "MENU":
-            draft["menu"] = "tags"
-            await refresh_draft_message(context, draft)
-            await query.answer()
-            return
-        if len(data) == 4 and data[2] == "TOGGLE":
-            try:
-                index = int(data[3])
-            except ValueError:
-                await query.answer()
-                return
-            if 0 <= index < len(TAG_OPTIONS):
-                tag = TAG_OPTIONS[index]
-                draft["tags"] = toggle_tag(draft.get("tags"), tag)
-                await refresh_draft_message(context, draft)
-                active = tag in tags_from_csv(draft.get("tags"))
-                await query.answer("Тег добавлен" if active else "Тег убран")
-                return
-            await query.answer()
-            return
 
-    if action == "SAVE":
-        await add_save(update, context, draft)
+async def _add_tag_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object], arg: str) -> None:
+    query = update.callback_query
+    try:
+        index = int(arg)
+    except ValueError:
+        await query.answer()
+        return
+    if not 0 <= index < len(TAG_OPTIONS):
+        await query.answer()
         return
+    tag = TAG_OPTIONS[index]
+    draft["tags"] = toggle_tag(draft.get("tags"), tag)
+    await refresh_draft_message(context, draft)
+    active = tag in tags_from_csv(draft.get("tags"))
+    await query.answer("Тег добавлен" if active else "Тег убран")
+
+
+async def _add_save(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object], arg: str
+) -> Optional[int]:
+    return await add_save(update, context, draft)
 
-    if action == "CANCEL":
+
+async def _add_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE, draft: Dict[str, object], arg: str) -> int:
+    await add_cancel(context, draft)
+    await update.callback_query.answer("Черновик отменён")
+    return ConversationHandler.END
+
+
+async def add_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    draft = context.user_data.get(DRAFT_KEY)
+    if draft:
         await add_cancel(context, draft)
-        if update.effective_chat and update.effective_user:
-            _end_conversation_for_user(
-                context, update.effective_chat.id, update.effective_user.id
-            )
-        await query.answer("Черновик отменён")
-        return
 
-    if action == "BACK":
-        draft["menu"] = "main"
-        await refresh_draft_message(context, draft)
-        await query.answer()
-        return
 
-    await query.answer()
+# Exact callback_data -> (handler, arg); parameterised actions are matched by prefix.
+ADD_ACTIONS = {
+    "ADD:PHOTO": (_add_photo, ""),
+    "ADD:PRICE:MENU": (_add_open_menu, "price"),
+    "ADD:PRICE:SET:YES": (_add_price_yes, ""),
+    "ADD:PRICE:SET:NO": (_add_price_no, ""),
+    "ADD:WHEN:MENU": (_add_open_menu, "when"),
+    "ADD:TAGS:MENU": (_add_open_menu, "tags"),
+    "ADD:SAVE": (_add_save, ""),
+    "ADD:CANCEL": (_add_cancel, ""),
+    "ADD:BACK": (_add_open_menu, "main"),
+}
+ADD_PREFIX_ACTIONS = {
+    "ADD:WHEN:SET:": _add_when_set,
+    "ADD:TAGS:TOGGLE:": _add_tag_toggle,
+}
+
+
+async def add_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[int]:
+    query = update.callback_query
+    draft = context.user_data.get(DRAFT_KEY)
+    if not draft:
+        await query.answer("Черновик не найден. Начните заново через /add.", show_alert=True)
+        try:
+            await query.edit_message_reply_markup(reply_markup=None)
+        except BadRequest:
+            pass
+        return ConversationHandler.END
+
+    data = query.data or ""
+    action = ADD_ACTIONS.get(data)
+    if action is None:
+        prefix, _, arg = data.rpartition(":")
+        handler = ADD_PREFIX_ACTIONS.get(f"{prefix}:")
+        action = (handler, arg) if handler else None
+    if action is None:
+        await query.answer()
+        return None
+    handler, arg = action
+    # Handlers return None to stay in DETAILS and END once the draft is saved or cancelled.
+    return await handler(update, context, draft, arg)
 
 
 async def list_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await send_list_page(update, context, page=0)
 
 
+def _total_pages(total: int, per_page: int) -> int:
+    return max(1, (total + per_page - 1) // per_page)
+
+
+def _list_line(wish: Wish) -> str:
+    horizon = wish.time_horizon or "Без срока"
+    if wish.due_date:
+        horizon = f"{horizon} — {wish.due_date.isoformat()}"
+    return f"#{wish.id} — {html.escape(wish.title)} ({html.escape(horizon)})"
+
+
 def build_list_text(wishes: list[Wish], page: int, total: int, per_page: int) -> str:
     if not total:
         return "Пока пусто. Добавить через /add или кнопку «➕ Добавить»."
-    lines = ["<b>Список желаний</b>"]
-    for wish in wishes:
-        horizon = wish.time_horizon or "Без срока"
-        if wish.due_date:
-            horizon = f"{horizon} — {wish.due_date.isoformat()}"
-        lines.append(f"#{wish.id} — {html.escape(wish.title)} ({html.escape(horizon)})")
-    total_pages = max(1, (total + per_page - 1) // per_page)
-    lines.append(f"Стр. {page + 1} из {total_pages}")
+    lines = ["<b>Список желаний</b>", *map(_list_line, wishes)]
+    lines.append(f"Стр. {page + 1} из {_total_pages(total, per_page)}")
     return "\n".join(lines)
 
 
-def list_keyboard(page: int, total: int, per_page: int) -> Optional[InlineKeyboardMarkup]:
-    total_pages = max(1, (total + per_page - 1) // per_page)
-    if total_pages <= 1:
+def list_keyboard(page: int, total: int, per_page: int, wishes: list[Wish]) -> Optional[InlineKeyboardMarkup]:
+    total_pages = _total_pages(total, per_page)
+    if total_pages <= 1 or not wishes:
         return None
+    # Page buttons carry the edge wish id so the next page is a keyset seek, not an OFFSET scan.
     buttons = []
     if page > 0:
-        buttons.append(InlineKeyboardButton("« Назад", callback_data=f"LIST:{page - 1}"))
+        buttons.append(InlineKeyboardButton("« Назад", callback_data=f"LIST:P:{page - 1}:{wishes[0].id}"))
     if page < total_pages - 1:
-        buttons.append(InlineKeyboardButton("Дальше »", callback_data=f"LIST:{page + 1}"))
+        buttons.append(InlineKeyboardButton("Дальше »", callback_data=f"LIST:N:{page + 1}:{wishes[-1].id}"))
     return InlineKeyboardMarkup([buttons]) if buttons else None
 
 
-async def send_list_page(update_or_query: Update, context: ContextTypes.DEFAULT_TYPE, page: int) -> None:
+async def send_list_page(
+    update_or_query: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    page: int,
+    pivot_id: Optional[int] = None,
+    backward: bool = False,
+) -> None:
     chat = update_or_query.effective_chat
     if not chat:
         return
     chat_id = chat.id
     await ensure_chat_meta(chat_id)
     per_page = 10
-    wishes, total = await asyncio.to_thread(list_wishes, chat_id, "open", None, per_page, page * per_page)
+    wishes, total = await run_storage(list_wishes_page, chat_id, "open", page, per_page, pivot_id, backward)
     text = build_list_text(wishes, page, total, per_page)
-    keyboard = list_keyboard(page, total, per_page)
+    keyboard = list_keyboard(page, total, per_page, wishes)
     if update_or_query.callback_query:
         try:
             await update_or_query.callback_query.edit_message_text(
@@ -586,11 +738,16 @@ async def send_list_page(update_or_query: Update, context: ContextTypes.DEFAULT_
 async def list_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
+    parts = query.data.split(":")
+    pivot_id = None
     try:
-        page = int(query.data.split(":")[1])
+        if len(parts) == 4:
+            page, pivot_id = int(parts[2]), int(parts[3])
+        else:
+            page = int(parts[1])
     except (IndexError, ValueError):
         return
-    await send_list_page(update, context, page)
+    await send_list_page(update, context, page, pivot_id, backward=parts[1] == "P")
 
 
 async def summary_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -599,9 +756,9 @@ async def summary_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     chat_id = chat.id
     await ensure_chat_meta(chat_id)
-    stats_task = asyncio.to_thread(count_stats, chat_id)
-    nearest_task = asyncio.to_thread(nearest_with_date, chat_id)
-    random_task = asyncio.to_thread(random_open_wish, chat_id)
+    stats_task = run_storage(count_stats, chat_id)
+    nearest_task = run_storage(nearest_with_date, chat_id)
+    random_task = run_storage(random_open_wish, chat_id)
     stats, nearest, random_wish_obj = await asyncio.gather(
         stats_task, nearest_task, random_task
     )
@@ -616,6 +773,7 @@ async def summary_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await update.effective_message.reply_text(text, parse_mode=ParseMode.HTML)
 
 
+@lru_cache(maxsize=None)
 def random_keyboard(index: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         [
@@ -668,7 +826,7 @@ async def random_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await ensure_chat_meta(chat_id)
         user = query.from_user
         tags_csv = ",".join(idea.get("tags", [])) or None
-        wish = await asyncio.to_thread(
+        wish = await run_storage(
             create_wish,
             chat_id=chat_id,
             user_id=user.id,
@@ -715,7 +873,7 @@ async def wish_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         await query.answer("Только администраторы могут это делать.", show_alert=True)
         return
     if action == "DONE":
-        wish = await asyncio.to_thread(mark_done, wish_id)
+        wish = await run_storage(mark_done, wish_id)
         if not wish or wish.chat_id != chat_id:
             await query.answer("Запись не найдена", show_alert=True)
             return
@@ -727,7 +885,7 @@ async def wish_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             await query.edit_message_text(caption, parse_mode=ParseMode.HTML, reply_markup=keyboard)
         await query.answer("Готово! 💫")
     elif action == "DEL":
-        ok = await asyncio.to_thread(delete_wish, wish_id)
+        ok = await run_storage(delete_wish, wish_id)
         if not ok:
             await query.answer("Не получилось удалить", show_alert=True)
             return
@@ -756,11 +914,21 @@ async def user_can_manage(
     if chat_type == "private":
         return True
 
+    key = (chat_id, user_id)
+    now = time.monotonic()
+    cached = _admin_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
     try:
         member = await context.bot.get_chat_member(chat_id, user_id)
     except Exception:
         return False
-    return member.status in {"creator", "administrator"}
+    is_admin = member.status in ADMIN_STATUSES
+    if len(_admin_cache) >= ADMIN_CACHE_MAX_SIZE:
+        _admin_cache.clear()
+    _admin_cache[key] = (now + ADMIN_CACHE_TTL, is_admin)
+    return is_admin
 
 
 async def done_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -781,7 +949,7 @@ async def done_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     if not await user_can_manage(chat_id, user.id, context, chat.type):
         await update.effective_message.reply_text("Только администраторы могут отмечать выполненным.")
         return
-    wish = await asyncio.to_thread(mark_done, wish_id)
+    wish = await run_storage(mark_done, wish_id)
     if not wish or wish.chat_id != chat_id:
         await update.effective_message.reply_text("Желание не найдено в этом чате.")
         return
@@ -806,49 +974,128 @@ async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if not await user_can_manage(chat_id, user.id, context, chat.type):
         await update.effective_message.reply_text("Только администраторы могут удалять желания.")
         return
-    ok = await asyncio.to_thread(delete_wish, wish_id)
+    ok = await run_storage(delete_wish, wish_id)
     if not ok:
         await update.effective_message.reply_text("Запись не найдена.")
         return
     await update.effective_message.reply_text(f"Желание #{wish_id} удалено 🗑")
 
 
+MENU_ROUTES = {
+    "📋 Список": list_command,
+    "🎲 Рандом": random_command,
+    "🧾 Сводка": summary_command,
+}
+
+# Filters are built once; Text() is a set lookup where Regex() ran a match per update.
+ADD_BUTTON_FILTER = filters.Text(["➕ Добавить"])
+MENU_FILTER = filters.Text(list(MENU_ROUTES))
+
+
+class _PlainTextFilter(filters.MessageFilter):
+    """filters.TEXT & ~filters.COMMAND as a single check."""
+
+    __slots__ = ()
+
+    def filter(self, message: Message) -> bool:
+        if not message.text:
+            return False
+        entities = message.entities
+        return not (entities and entities[0].type == MessageEntity.BOT_COMMAND and entities[0].offset == 0)
+
+
+class _PlainTextReplyFilter(_PlainTextFilter):
+    """filters.TEXT & filters.REPLY & ~filters.COMMAND as a single check."""
+
+    __slots__ = ()
+
+    def filter(self, message: Message) -> bool:
+        return bool(message.reply_to_message) and super().filter(message)
+
+
+TITLE_REPLY_FILTER = _PlainTextReplyFilter(name="TITLE_REPLY_FILTER")
+DETAILS_TEXT_FILTER = _PlainTextFilter(name="DETAILS_TEXT_FILTER")
+
+
+def _data_prefix(prefix: str) -> Callable[[object], bool]:
+    # CallbackQueryHandler accepts a predicate; startswith avoids a regex match per callback query.
+    return lambda data: isinstance(data, str) and data.startswith(prefix)
+
+
 async def handle_menu_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    text = update.message.text.strip()
-    if text == "📋 Список":
-        await list_command(update, context)
-    elif text == "🎲 Рандом":
-        await random_command(update, context)
-    elif text == "🧾 Сводка":
-        await summary_command(update, context)
+    handler = MENU_ROUTES.get(update.message.text.strip())
+    if handler:
+        await handler(update, context)
+
+
+async def _wait_job_send_slot() -> None:
+    global _job_send_next_slot
+    async with _job_send_lock:
+        now = time.monotonic()
+        slot = max(now, _job_send_next_slot)
+        _job_send_next_slot = slot + 1 / JOB_SEND_RATE
+    await asyncio.sleep(slot - now)
+
+
+async def _send_job_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str, **kwargs) -> None:
+    for attempt in range(JOB_SEND_ATTEMPTS):
+        try:
+            await _wait_job_send_slot()
+            await context.bot.send_message(chat_id, text, **kwargs)
+            return
+        except RetryAfter as exc:
+            if attempt == JOB_SEND_ATTEMPTS - 1:
+                raise
+            # Jitter so chats throttled together do not retry in lockstep.
+            await asyncio.sleep(exc.retry_after + random.uniform(0, 1))
+
+
+def _log_job_failures(job: str, results: list) -> None:
+    failed = [result for result in results if isinstance(result, Exception)]
+    if failed:
+        logger.warning(
+            "%s: не отправлено %d из %d, первая ошибка: %r", job, len(failed), len(results), failed[0]
+        )
 
 
 async def add_job_biweekly(context: ContextTypes.DEFAULT_TYPE) -> None:
-    chats = await asyncio.to_thread(list_chats)
-    now = datetime.utcnow()
-    for chat in chats:
-        last_added = chat.last_added_at or chat.created_at
-        if not last_added or now - last_added >= timedelta(days=14):
-            idea = random.choice(RANDOM_IDEAS)
-            text = (
-                "Вы классные 💞 Добавим маленькую хотелку? ✨\n"
-                f"• {idea['title']} — {idea['description']}"
+    threshold = datetime.utcnow() - timedelta(days=REMINDER_IDLE_DAYS)
+    chat_ids = await run_storage(list_idle_chats, threshold)
+    results = await asyncio.gather(
+        *(
+            _send_job_message(
+                context, chat_id, BIWEEKLY_REMINDER_TEMPLATE.format_map(random.choice(RANDOM_IDEAS))
             )
-            try:
-                await context.bot.send_message(chat.chat_id, text)
-            except Exception as exc:  # pragma: no cover - уведомления должны быть мягкими
-                logger.debug("Не удалось отправить напоминание: %s", exc)
+            for chat_id in chat_ids
+        ),
+        return_exceptions=True,
+    )
+    _log_job_failures("Напоминание", results)
+
+
+async def biweekly_reminder_tick(context: ContextTypes.DEFAULT_TYPE) -> None:
+    if (datetime.now(JOB_TZ).date() - BIWEEKLY_ANCHOR).days % 14 == 0:
+        await add_job_biweekly(context)
+
+
+def _load_monthly_digest() -> tuple:
+    return (
+        list_chats(),
+        count_stats_by_chat(),
+        nearest_with_date_by_chat(),
+        random_open_wish_by_chat(),
+    )
 
 
 async def add_job_monthly(context: ContextTypes.DEFAULT_TYPE) -> None:
-    chats = await asyncio.to_thread(list_chats)
+    chats, stats_by_chat, nearest_by_chat, random_by_chat = await run_storage(
+        _load_monthly_digest
+    )
+    sends = []
     for chat in chats:
-        stats_task = asyncio.to_thread(count_stats, chat.chat_id)
-        nearest_task = asyncio.to_thread(nearest_with_date, chat.chat_id)
-        random_task = asyncio.to_thread(random_open_wish, chat.chat_id)
-        stats, nearest, random_wish_obj = await asyncio.gather(
-            stats_task, nearest_task, random_task
-        )
+        stats = stats_by_chat.get(chat.chat_id, {})
+        nearest = nearest_by_chat.get(chat.chat_id)
+        random_wish_obj = random_by_chat.get(chat.chat_id)
         header = (
             f"У вас уже {stats.get('total_open', 0)} тёплых планов 💖"
             if stats.get("total_open", 0)
@@ -859,17 +1106,19 @@ async def add_job_monthly(context: ContextTypes.DEFAULT_TYPE) -> None:
             "by_horizon": stats.get("by_horizon", {}),
             "nearest": nearest,
             "random": random_wish_obj,
-            "motivation": random.choice(MOTIVATION_PHRASES),
+            "motivation": next(_motivation_phrases),
         }
         body = build_summary_text(payload)
-        try:
-            await context.bot.send_message(
+        sends.append(
+            _send_job_message(
+                context,
                 chat.chat_id,
                 f"{header}\n\n{body}",
                 parse_mode=ParseMode.HTML,
             )
-        except Exception as exc:  # pragma: no cover
-            logger.debug("Не удалось отправить ежемесячную сводку: %s", exc)
+        )
+    results = await asyncio.gather(*sends, return_exceptions=True)
+    _log_job_failures("Ежемесячная сводка", results)
 
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -877,19 +1126,20 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
 
 
 async def post_init(application: Application) -> None:
-    application.job_queue.run_repeating(
-        add_job_biweekly,
-        interval=14 * 24 * 60 * 60,
-        first=60,
+    chats = await run_storage(list_chats)
+    _known_chat_ids.update(chat.chat_id for chat in chats if chat.timezone == DEFAULT_TZ)
+    application.job_queue.run_daily(
+        biweekly_reminder_tick,
+        time=JOB_TIME,
         name="biweekly_reminder",
-        misfire_grace_time=300,
+        job_kwargs={"misfire_grace_time": 300},
     )
-    application.job_queue.run_repeating(
+    application.job_queue.run_monthly(
         add_job_monthly,
-        interval=30 * 24 * 60 * 60,
-        first=120,
+        when=JOB_TIME,
+        day=1,
         name="monthly_summary",
-        misfire_grace_time=300,
+        job_kwargs={"misfire_grace_time": 300},
     )
 
 
@@ -897,7 +1147,9 @@ def build_application() -> Application:
     application = (
         ApplicationBuilder()
         .token(TELEGRAM_BOT_TOKEN)
-        .parse_mode(ParseMode.HTML)
+        # HTTP/2 multiplexes concurrent sends over a connection; PTB's default pool (256) is kept.
+        .http_version("2")
+        .get_updates_http_version("2")
         .post_init(post_init)
         .build()
     )
@@ -905,28 +1157,35 @@ def build_application() -> Application:
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("help", help_command))
 
-    global ADD_CONV_HANDLER
-    ADD_CONV_HANDLER = ConversationHandler(
-        entry_points=[
-            CommandHandler("add", add_entry),
-            MessageHandler(filters.Regex(r"^➕ Добавить$"), add_entry),
-        ],
-        states={
-            ASK_TITLE: [MessageHandler(filters.TEXT & filters.REPLY & ~filters.COMMAND, add_receive_title)],
-            DETAILS: [
-                MessageHandler(filters.PHOTO, add_handle_photo),
-                MessageHandler(filters.TEXT & ~filters.COMMAND, add_handle_text),
+    with warnings.catch_warnings():
+        # Draft buttons are meant to be tracked per (chat, user), not per message.
+        warnings.filterwarnings("ignore", message="If 'per_message=False'", category=PTBUserWarning)
+        add_conversation = ConversationHandler(
+            entry_points=[
+                CommandHandler("add", add_entry),
+                MessageHandler(ADD_BUTTON_FILTER, add_entry),
             ],
-        },
-        fallbacks=[],
-        allow_reentry=True,
-        per_chat=True,
-        per_user=True,
-    )
-    application.add_handler(ADD_CONV_HANDLER)
+            states={
+                ASK_TITLE: [MessageHandler(TITLE_REPLY_FILTER, add_receive_title)],
+                DETAILS: [
+                    MessageHandler(filters.PHOTO, add_handle_photo),
+                    MessageHandler(DETAILS_TEXT_FILTER, add_handle_text),
+                    CallbackQueryHandler(add_callback, pattern=_data_prefix("ADD:")),
+                ],
+                ConversationHandler.TIMEOUT: [TypeHandler(Update, add_timeout)],
+            },
+            fallbacks=[],
+            allow_reentry=True,
+            conversation_timeout=ADD_CONVERSATION_TIMEOUT,
+            per_chat=True,
+            per_user=True,
+            per_message=False,
+        )
+    application.add_handler(add_conversation)
 
-    application.add_handler(CallbackQueryHandler(add_callback, pattern=r"^ADD:"))
-    application.add_handler(MessageHandler(filters.Regex(r"^(📋 Список|🎲 Рандом|🧾 Сводка)$"), handle_menu_buttons))
+    # Taps on draft buttons outside a live conversation, e.g. after a restart.
+    application.add_handler(CallbackQueryHandler(add_callback, pattern=_data_prefix("ADD:")))
+    application.add_handler(MessageHandler(MENU_FILTER, handle_menu_buttons))
 
     application.add_handler(CommandHandler("list", list_command))
     application.add_handler(CommandHandler("random", random_command))
@@ -934,17 +1193,27 @@ def build_application() -> Application:
     application.add_handler(CommandHandler("done", done_command))
     application.add_handler(CommandHandler("delete", delete_command))
 
-    application.add_handler(CallbackQueryHandler(list_callback, pattern=r"^LIST:"))
-    application.add_handler(CallbackQueryHandler(random_callback, pattern=r"^RAND:"))
-    application.add_handler(CallbackQueryHandler(wish_callback, pattern=r"^WISH:"))
+    application.add_handler(CallbackQueryHandler(list_callback, pattern=_data_prefix("LIST:")))
+    application.add_handler(CallbackQueryHandler(random_callback, pattern=_data_prefix("RAND:")))
+    application.add_handler(CallbackQueryHandler(wish_callback, pattern=_data_prefix("WISH:")))
 
     application.add_error_handler(error_handler)
     return application
 
 
 def main() -> None:
+    try:
+        import uvloop
+    except ImportError:  # pragma: no cover - optional, not available on Windows
+        pass
+    else:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     application = build_application()
-    application.run_polling()
+    application.run_polling(
+        timeout=POLLING_TIMEOUT,
+        drop_pending_updates=True,
+        allowed_updates=[Update.MESSAGE, Update.CALLBACK_QUERY],
+    )
 
 
 if __name__ == "__main__":
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
 import os
+import threading
 from contextlib import contextmanager
 from datetime import date, datetime
 from pathlib import Path
 from typing import Dict, Iterator, List, Optional, Tuple
 
-from sqlalchemy import Boolean, Date, DateTime, Integer, String, Text, create_engine, func, select
+from sqlalchemy import BigInteger, Boolean, Date, DateTime, Index, Integer, String, Text, and_, create_engine, delete, event, func, or_, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column, sessionmaker
 
@@ -17,14 +20,20 @@ __all__ = [
     "get_or_init_chat_meta",
     "create_wish",
     "list_wishes",
+    "list_wishes_keyset",
+    "list_wishes_page",
     "random_open_wish",
+    "random_open_wish_by_chat",
     "nearest_with_date",
+    "nearest_with_date_by_chat",
     "count_stats",
+    "count_stats_by_chat",
     "get_wish",
     "update_wish",
     "mark_done",
     "delete_wish",
     "list_chats",
+    "list_idle_chats",
 ]
 
 
@@ -33,6 +42,22 @@ DATABASE_URL = os.getenv("DATABASE_URL", DEFAULT_DATABASE_URL)
 
 _engine: Optional[Engine] = None
 _Session: Optional[sessionmaker[Session]] = None
+_configure_lock = threading.Lock()
+
+# WAL with synchronous=NORMAL drops the per-commit fsync from the write path.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-64000",
+)
+
+# Dialects with INSERT ... ON CONFLICT support; others fall back to SELECT + INSERT.
+_UPSERT_INSERTS = {
+    "postgresql": postgresql_insert,
+    "sqlite": sqlite_insert,
+}
 
 
 class Base(DeclarativeBase):
@@ -42,7 +67,7 @@ class Base(DeclarativeBase):
 class ChatMeta(Base):
     __tablename__ = "chats"
 
-    chat_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     timezone: Mapped[str] = mapped_column(String(64), nullable=False)
     last_added_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
@@ -50,10 +75,14 @@ class ChatMeta(Base):
 
 class Wish(Base):
     __tablename__ = "wishes"
+    __table_args__ = (
+        Index("ix_wishes_chat_status_created", "chat_id", "status", "created_at"),
+        Index("ix_wishes_chat_status_due", "chat_id", "status", "due_date"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    chat_id: Mapped[int] = mapped_column(Integer, index=True, nullable=False)
-    user_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    user_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
     user_first_name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     user_username: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     title: Mapped[str] = mapped_column(String(120), nullable=False)
@@ -80,32 +109,55 @@ def configure_engine(database_url: Optional[str] = None) -> None:
         os.makedirs("/app/data", exist_ok=True)
         if url.database:
             Path(url.database).parent.mkdir(parents=True, exist_ok=True)
+        # A local file has no connection to lose, so skip the per-checkout ping.
+        engine_options: Dict[str, object] = {"connect_args": {"check_same_thread": False}}
+    else:
+        engine_options = {
+            "pool_size": 10,
+            "max_overflow": 10,
+            "pool_recycle": 1800,
+            "pool_pre_ping": True,
+        }
 
-    engine = create_engine(
-        target_url,
-        connect_args={"check_same_thread": False} if url.get_backend_name() == "sqlite" else {},
-        pool_pre_ping=True,
-    )
+    engine = create_engine(target_url, **engine_options)
+    if url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:"):
+        event.listen(engine, "connect", _apply_sqlite_pragmas)
 
     if _engine is not None:
         _engine.dispose()
 
     Base.metadata.create_all(engine)
+    # create_all() skips tables that already exist, so add new indexes explicitly.
+    for index in Wish.__table__.indexes:
+        index.create(engine, checkfirst=True)
 
     DATABASE_URL = target_url
     _engine = engine
     _Session = sessionmaker(bind=_engine, expire_on_commit=False)
 
 
-configure_engine(DATABASE_URL)
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
 
 
-@contextmanager
-def session_scope() -> Iterator[Session]:
+def _session_factory() -> sessionmaker[Session]:
+    """Return the session factory, configuring the engine on first use."""
+
     if _Session is None:
-        raise RuntimeError("Database engine is not configured.")
+        with _configure_lock:
+            if _Session is None:
+                configure_engine()
+    return _Session
 
-    session: Session = _Session()
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    session: Session = _session_factory()()
     try:
         yield session
         session.commit()
@@ -119,16 +171,22 @@ def session_scope() -> Iterator[Session]:
 def get_or_init_chat_meta(chat_id: int, timezone: str) -> ChatMeta:
     with session_scope() as session:
         meta = session.get(ChatMeta, chat_id)
-        if meta:
-            if timezone and meta.timezone != timezone:
-                meta.timezone = timezone
-            session.flush()
-            session.refresh(meta)
-            return meta
-        meta = ChatMeta(chat_id=chat_id, timezone=timezone)
-        session.add(meta)
+        if meta is None:
+            # Dialect inserts carry no SQL cache key, so keep them off the hot path.
+            insert = _UPSERT_INSERTS.get(session.get_bind().dialect.name)
+            if insert is not None:
+                session.execute(
+                    insert(ChatMeta)
+                    .values(chat_id=chat_id, timezone=timezone, created_at=datetime.utcnow())
+                    .on_conflict_do_nothing(index_elements=[ChatMeta.chat_id])
+                )
+                meta = session.get(ChatMeta, chat_id)
+        if meta is None:
+            meta = ChatMeta(chat_id=chat_id, timezone=timezone)
+            session.add(meta)
+        elif timezone and meta.timezone != timezone:
+            meta.timezone = timezone
         session.flush()
-        session.refresh(meta)
         return meta
 
 
@@ -197,7 +255,7 @@ def list_wishes(
         page_stmt = (
             select(Wish)
             .where(*filters)
-            .order_by(Wish.created_at.desc())
+            .order_by(Wish.created_at.desc(), Wish.id.desc())
             .limit(limit)
             .offset(offset)
         )
@@ -205,6 +263,74 @@ def list_wishes(
         return wishes, total
 
 
+def list_wishes_keyset(
+    chat_id: int,
+    status: Optional[str],
+    pivot_id: int,
+    limit: int = 10,
+    backward: bool = False,
+) -> Optional[Tuple[List[Wish], int]]:
+    """Return the page after (or before) ``pivot_id`` in ``list_wishes`` order.
+
+    Returns ``None`` when the pivot wish no longer exists in this chat, so the
+    caller can fall back to offset pagination.
+    """
+
+    limit = max(1, int(limit or 1))
+
+    with session_scope() as session:
+        pivot = session.get(Wish, pivot_id)
+        if pivot is None or pivot.chat_id != chat_id:
+            return None
+
+        filters = [Wish.chat_id == chat_id]
+        if status:
+            filters.append(Wish.status == status)
+
+        total_stmt = select(func.count(Wish.id)).where(*filters)
+        total = session.execute(total_stmt).scalar_one()
+
+        if backward:
+            cursor = or_(
+                Wish.created_at > pivot.created_at,
+                and_(Wish.created_at == pivot.created_at, Wish.id > pivot.id),
+            )
+            order_by = (Wish.created_at.asc(), Wish.id.asc())
+        else:
+            cursor = or_(
+                Wish.created_at < pivot.created_at,
+                and_(Wish.created_at == pivot.created_at, Wish.id < pivot.id),
+            )
+            order_by = (Wish.created_at.desc(), Wish.id.desc())
+
+        page_stmt = select(Wish).where(*filters, cursor).order_by(*order_by).limit(limit)
+        wishes = session.execute(page_stmt).scalars().all()
+        if backward:
+            wishes.reverse()
+        return wishes, total
+
+
+def list_wishes_page(
+    chat_id: int,
+    status: Optional[str],
+    page: int,
+    limit: int = 10,
+    pivot_id: Optional[int] = None,
+    backward: bool = False,
+) -> Tuple[List[Wish], int]:
+    """Return ``page`` of ``list_wishes``, seeking from ``pivot_id`` when possible.
+
+    The first page is always read from the top so wishes added since the list
+    was opened show up there; a stale or missing pivot falls back to OFFSET.
+    """
+
+    if page > 0 and pivot_id is not None:
+        result = list_wishes_keyset(chat_id, status, pivot_id, limit, backward)
+        if result is not None and (result[0] or not result[1]):
+            return result
+    return list_wishes(chat_id, status, None, limit, page * limit)
+
+
 def random_open_wish(chat_id: int) -> Optional[Wish]:
     with session_scope() as session:
         stmt = (
@@ -231,6 +357,42 @@ def nearest_with_date(chat_id: int) -> Optional[Wish]:
         return session.execute(stmt).scalar_one_or_none()
 
 
+def _build_stats(status_counts: Dict[str, int], by_horizon: Dict[str, int]) -> Dict[str, object]:
+    return {
+        "total_open": status_counts.get("open", 0),
+        "total_done": status_counts.get("done", 0),
+        "by_horizon": by_horizon,
+    }
+
+
+def _first_open_wish_by_chat(order_by, *criteria) -> Dict[int, Wish]:
+    with session_scope() as session:
+        ranked = (
+            select(
+                Wish.id,
+                func.row_number().over(partition_by=Wish.chat_id, order_by=order_by).label("rank"),
+            )
+            .where(Wish.status == "open", *criteria)
+            .subquery()
+        )
+        stmt = select(Wish).join(ranked, Wish.id == ranked.c.id).where(ranked.c.rank == 1)
+        return {wish.chat_id: wish for wish in session.execute(stmt).scalars()}
+
+
+def random_open_wish_by_chat() -> Dict[int, Wish]:
+    """Return random_open_wish() for every chat that has open wishes, in one query."""
+
+    return _first_open_wish_by_chat(func.random())
+
+
+def nearest_with_date_by_chat() -> Dict[int, Wish]:
+    """Return nearest_with_date() for every chat that has dated open wishes, in one query."""
+
+    return _first_open_wish_by_chat(
+        (Wish.due_date.asc(), Wish.id.asc()), Wish.due_date.is_not(None)
+    )
+
+
 def count_stats(chat_id: int) -> Dict[str, object]:
     with session_scope() as session:
         status_rows = session.execute(
@@ -247,11 +409,34 @@ def count_stats(chat_id: int) -> Dict[str, object]:
         ).all()
         by_horizon = {row[0] or "Без срока": row[1] for row in horizon_rows}
 
-        return {
-            "total_open": status_counts.get("open", 0),
-            "total_done": status_counts.get("done", 0),
-            "by_horizon": by_horizon,
-        }
+        return _build_stats(status_counts, by_horizon)
+
+
+def count_stats_by_chat() -> Dict[int, Dict[str, object]]:
+    """Return count_stats() for every chat that has wishes, in two queries."""
+
+    with session_scope() as session:
+        status_rows = session.execute(
+            select(Wish.chat_id, Wish.status, func.count())
+            .group_by(Wish.chat_id, Wish.status)
+        ).all()
+        horizon_rows = session.execute(
+            select(Wish.chat_id, Wish.time_horizon, func.count())
+            .where(Wish.status == "open")
+            .group_by(Wish.chat_id, Wish.time_horizon)
+        ).all()
+
+    status_counts: Dict[int, Dict[str, int]] = {}
+    for chat_id, status, count in status_rows:
+        status_counts.setdefault(chat_id, {})[status] = count
+    by_horizon: Dict[int, Dict[str, int]] = {}
+    for chat_id, horizon, count in horizon_rows:
+        by_horizon.setdefault(chat_id, {})[horizon or "Без срока"] = count
+
+    return {
+        chat_id: _build_stats(counts, by_horizon.get(chat_id, {}))
+        for chat_id, counts in status_counts.items()
+    }
 
 
 def get_wish(wish_id: int) -> Optional[Wish]:
@@ -288,14 +473,20 @@ def mark_done(wish_id: int) -> Optional[Wish]:
 
 def delete_wish(wish_id: int) -> bool:
     with session_scope() as session:
-        wish = session.get(Wish, wish_id)
-        if not wish:
-            return False
-        session.delete(wish)
-        return True
+        result = session.execute(delete(Wish).where(Wish.id == wish_id))
+        return result.rowcount > 0
 
 
 def list_chats() -> List[ChatMeta]:
     with session_scope() as session:
         stmt = select(ChatMeta)
         return list(session.execute(stmt).scalars())
+
+
+def list_idle_chats(threshold: datetime) -> List[int]:
+    """Return ids of chats with no wish added since ``threshold``."""
+
+    with session_scope() as session:
+        last_activity = func.coalesce(ChatMeta.last_added_at, ChatMeta.created_at)
+        stmt = select(ChatMeta.chat_id).where(last_activity <= threshold)
+        return list(session.execute(stmt).scalars())
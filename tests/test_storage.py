@@ -1,8 +1,9 @@
-from datetime import date
+from datetime import date, datetime, timedelta
 from pathlib import Path
 import sys
 
 import pytest
+from sqlalchemy import delete
 
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
@@ -11,13 +12,21 @@ if str(ROOT) not in sys.path:
 import storage
 
 
-@pytest.fixture()
-def configured_storage(tmp_path):
-    db_path = tmp_path / "test.db"
+@pytest.fixture(scope="module")
+def storage_engine(tmp_path_factory):
+    db_path = tmp_path_factory.mktemp("storage") / "test.db"
     storage.configure_engine(f"sqlite:///{db_path}")
     return storage
 
 
+@pytest.fixture()
+def configured_storage(storage_engine):
+    yield storage_engine
+    with storage.session_scope() as session:
+        session.execute(delete(storage.Wish))
+        session.execute(delete(storage.ChatMeta))
+
+
 def test_create_and_list(configured_storage):
     storage = configured_storage
     storage.get_or_init_chat_meta(1, "UTC")
@@ -103,6 +112,162 @@ def test_delete(configured_storage):
     )
     ok = storage.delete_wish(wish.id)
     assert ok is True
+    assert storage.delete_wish(wish.id) is False
     wishes, total = storage.list_wishes(chat_id=3)
     assert total == 0
     assert wishes == []
+
+
+def test_supergroup_ids(configured_storage):
+    storage = configured_storage
+    chat_id = -1001234567890
+    storage.get_or_init_chat_meta(chat_id, "UTC")
+    wish = storage.create_wish(
+        chat_id=chat_id,
+        user_id=6123456789,
+        user_username=None,
+        user_first_name="Аня",
+        title="Свидание на крыше",
+    )
+    wishes, total = storage.list_wishes(chat_id=chat_id)
+    assert total == 1
+    assert wishes[0].id == wish.id
+    assert wishes[0].user_id == 6123456789
+
+
+def test_count_stats_by_chat(configured_storage):
+    storage = configured_storage
+    for chat_id in (4, 5):
+        storage.get_or_init_chat_meta(chat_id, "UTC")
+    for title, horizon in (("Каток", "📅 Этот год"), ("Кино", None)):
+        storage.create_wish(
+            chat_id=4,
+            user_id=30,
+            user_username=None,
+            user_first_name="Оля",
+            title=title,
+            time_horizon=horizon,
+        )
+    done = storage.create_wish(
+        chat_id=4,
+        user_id=30,
+        user_username=None,
+        user_first_name="Оля",
+        title="Пикник",
+    )
+    storage.mark_done(done.id)
+
+    stats = storage.count_stats_by_chat()
+    assert stats[4] == storage.count_stats(4)
+    assert stats[4]["total_open"] == 2
+    assert stats[4]["total_done"] == 1
+    assert stats[4]["by_horizon"] == {"📅 Этот год": 1, "Без срока": 1}
+    assert 5 not in stats
+
+
+def test_first_open_wish_by_chat(configured_storage):
+    storage = configured_storage
+    for chat_id in (6, 7):
+        storage.get_or_init_chat_meta(chat_id, "UTC")
+    for chat_id, title, due in (
+        (6, "Море", date(2031, 6, 1)),
+        (6, "Горы", date(2030, 1, 15)),
+        (6, "Без даты", None),
+        (7, "Театр", None),
+    ):
+        storage.create_wish(
+            chat_id=chat_id,
+            user_id=40,
+            user_username=None,
+            user_first_name="Дима",
+            title=title,
+            due_date=due,
+        )
+
+    nearest = storage.nearest_with_date_by_chat()
+    assert nearest[6].title == "Горы"
+    assert nearest[6].id == storage.nearest_with_date(6).id
+    assert 7 not in nearest
+
+    random_picks = storage.random_open_wish_by_chat()
+    assert set(random_picks) == {6, 7}
+    assert random_picks[7].title == "Театр"
+    assert random_picks[6].chat_id == 6
+
+
+def test_list_wishes_keyset(configured_storage):
+    storage = configured_storage
+    storage.get_or_init_chat_meta(8, "UTC")
+    for index in range(7):
+        storage.create_wish(
+            chat_id=8,
+            user_id=50,
+            user_username=None,
+            user_first_name="Оля",
+            title=f"Желание {index}",
+        )
+
+    first_page, total = storage.list_wishes(8, "open", None, 3, 0)
+    second_page, _ = storage.list_wishes(8, "open", None, 3, 3)
+
+    forward, keyset_total = storage.list_wishes_keyset(8, "open", first_page[-1].id, 3)
+    assert keyset_total == total == 7
+    assert [wish.id for wish in forward] == [wish.id for wish in second_page]
+
+    backward, _ = storage.list_wishes_keyset(8, "open", second_page[0].id, 3, backward=True)
+    assert [wish.id for wish in backward] == [wish.id for wish in first_page]
+
+    assert storage.list_wishes_keyset(9, "open", first_page[-1].id, 3) is None
+    storage.delete_wish(first_page[-1].id)
+    assert storage.list_wishes_keyset(8, "open", first_page[-1].id, 3) is None
+
+
+def test_list_idle_chats(configured_storage):
+    storage = configured_storage
+    for chat_id in (11, 12, 13):
+        storage.get_or_init_chat_meta(chat_id, "UTC")
+    old = datetime.utcnow() - timedelta(days=30)
+    with storage.session_scope() as session:
+        session.get(storage.ChatMeta, 11).created_at = old
+        quiet = session.get(storage.ChatMeta, 12)
+        quiet.created_at = old
+        quiet.last_added_at = old
+    storage.create_wish(
+        chat_id=11,
+        user_id=60,
+        user_username=None,
+        user_first_name="Аня",
+        title="Пикник",
+    )
+
+    threshold = datetime.utcnow() - timedelta(days=14)
+    assert storage.list_idle_chats(threshold) == [12]
+
+
+def test_list_wishes_page_back_to_first(configured_storage):
+    storage = configured_storage
+    storage.get_or_init_chat_meta(14, "UTC")
+
+    def add(title):
+        return storage.create_wish(
+            chat_id=14,
+            user_id=70,
+            user_username=None,
+            user_first_name="Лена",
+            title=title,
+        )
+
+    for index in range(5):
+        add(f"Старое {index}")
+    first_page, _ = storage.list_wishes_page(14, "open", 0, 3)
+    second_page, _ = storage.list_wishes_page(14, "open", 1, 3, first_page[-1].id)
+    assert [wish.title for wish in second_page] == ["Старое 1", "Старое 0"]
+
+    fresh = add("Новое")
+    back, total = storage.list_wishes_page(14, "open", 0, 3, second_page[0].id, backward=True)
+    assert total == 6
+    assert back[0].id == fresh.id
+    assert [wish.id for wish in back[1:]] == [wish.id for wish in first_page[:2]]
+
+    stale, _ = storage.list_wishes_page(14, "open", 1, 3, 10**9)
+    assert [wish.title for wish in stale] == ["Старое 2", "Старое 1", "Старое 0"]
@@ -2,7 +2,8 @@ from __future__ import annotations
 
 import html
 from datetime import date
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
 from storage import Wish
 
@@ -505,42 +506,48 @@ def format_wish_caption(wish: Wish) -> str:
     return "\n".join(lines)
 
 
-def build_summary_text(summary: Dict[str, object]) -> str:
-    lines = ["<b>Сводка по желаниям</b>"]
-    total_open = int(summary.get("total_open", 0))
-    lines.append(f"Открыто: <b>{total_open}</b>")
+SUMMARY_TEMPLATE = (
+    "<b>Сводка по желаниям</b>\n"
+    "Открыто: <b>{total_open}</b>\n"
+    "По срокам: {by_horizon}\n"
+    "Ближайшее: {nearest}\n"
+    "Случайная открытая идея: {random}"
+)
+
 
+def build_summary_text(summary: Dict[str, object]) -> str:
     by_horizon: Dict[str, int] = summary.get("by_horizon", {}) or {}
     if by_horizon:
-        parts = [f"{html.escape(name)} — {count}" for name, count in by_horizon.items()]
-        lines.append("По срокам: " + ", ".join(parts))
+        horizon_text = ", ".join(f"{html.escape(name)} — {count}" for name, count in by_horizon.items())
     else:
-        lines.append("По срокам: пока без отметок.")
+        horizon_text = "пока без отметок."
 
     nearest: Optional[Wish] = summary.get("nearest")  # type: ignore[assignment]
     if nearest and nearest.due_date:
-        lines.append(
-            f"Ближайшее: <b>{html.escape(nearest.title)}</b> — {nearest.due_date.isoformat()}"
-        )
+        nearest_text = f"<b>{html.escape(nearest.title)}</b> — {nearest.due_date.isoformat()}"
     elif nearest:
-        horizon = nearest.time_horizon or "без срока"
-        lines.append(
-            f"Ближайшее: <b>{html.escape(nearest.title)}</b> — {html.escape(horizon)}"
-        )
+        nearest_text = f"<b>{html.escape(nearest.title)}</b> — {html.escape(nearest.time_horizon or 'без срока')}"
     else:
-        lines.append("Ближайшее: пока нет точных дат.")
+        nearest_text = "пока нет точных дат."
 
     random_wish: Optional[Wish] = summary.get("random")  # type: ignore[assignment]
     if random_wish:
-        lines.append(f"Случайная открытая идея: <b>{html.escape(random_wish.title)}</b>")
+        random_text = f"<b>{html.escape(random_wish.title)}</b>"
     else:
-        lines.append("Случайная открытая идея: добавьте хотя бы одну мечту 💛")
-
+        random_text = "добавьте хотя бы одну мечту 💛"
+
+    text = SUMMARY_TEMPLATE.format_map(
+        {
+            "total_open": int(summary.get("total_open", 0)),
+            "by_horizon": horizon_text,
+            "nearest": nearest_text,
+            "random": random_text,
+        }
+    )
     motivation = summary.get("motivation")
     if motivation:
-        lines.append(f"Мотивашка: {html.escape(str(motivation))}")
-
-    return "\n".join(lines)
+        text = f"{text}\nМотивашка: {html.escape(str(motivation))}"
+    return text
 
 
 def parse_price(text: str) -> object:
@@ -578,10 +585,15 @@ def toggle_tag(csv: Optional[str], tag: str) -> str:
     return ",".join(dict.fromkeys(tags))
 
 
+@lru_cache(maxsize=256)
+def _split_tags(csv: str) -> Tuple[str, ...]:
+    return tuple(part.strip() for part in csv.split(",") if part.strip())
+
+
 def tags_from_csv(csv: Optional[str]) -> List[str]:
     if not csv:
         return []
-    return [part.strip() for part in csv.split(",") if part.strip()]
+    return list(_split_tags(csv))
 
 
 def format_random_idea(idea: Dict[str, object]) -> str: